@@ -1,10 +1,15 @@
 import streamlit as st
 import pandas as pd
+import pyarrow as pa
 import duckdb
 import requests
+import orjson
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import zipfile
-import io
-import xml.etree.ElementTree as ET
+import shutil
+import tempfile
+from lxml import etree
 import os
 import concurrent.futures
 import time
@@ -47,20 +52,52 @@ else:
     # 로컬 DuckDB 연결
     DB_PATH = "financial_data.duckdb"
 
+# DART API 동시 호출 수 (requests 연결 풀 크기와 동일하게 유지)
+API_MAX_WORKERS = 20
+
+@st.cache_resource
+def get_http_session() -> requests.Session:
+    """DART API 호출에 공유할 세션을 만듭니다. (연결 재사용 + 일시 오류 재시도)"""
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=API_MAX_WORKERS,
+        pool_maxsize=API_MAX_WORKERS,
+        max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504])
+    )
+    session.mount('https://', adapter)
+    return session
+
 # ==========================================
 # 1. Database 초기화
 # ==========================================
+@st.cache_resource
+def get_conn() -> duckdb.DuckDBPyConnection:
+    """프로세스 전체에서 재사용할 DuckDB 연결을 한 번만 생성합니다."""
+    if MD_TOKEN:
+        # MotherDuck 연결 시 토큰을 config로 전달
+        conn = duckdb.connect(DB_PATH, config={'motherduck_token': MD_TOKEN})
+        # MotherDuck에서는 DB가 없을 수 있으므로 생성 및 사용 설정
+        conn.execute("CREATE DATABASE IF NOT EXISTS dart_financials")
+        conn.execute("USE dart_financials")
+    else:
+        conn = duckdb.connect(DB_PATH)
+    return conn
+
+def get_cursor() -> duckdb.DuckDBPyConnection:
+    """공유 연결에서 커서를 만듭니다. 스레드마다 별도 커서를 사용해야 안전합니다."""
+    cursor = get_conn().cursor()
+    if MD_TOKEN:
+        # 커서는 USE 설정을 물려받지 않으므로 다시 지정
+        cursor.execute("USE dart_financials")
+    return cursor
+
+@st.cache_resource
 def init_db():
-    try:
-        if MD_TOKEN:
-            # MotherDuck 연결 시 토큰을 config로 전달
-            conn = duckdb.connect(DB_PATH, config={'motherduck_token': MD_TOKEN})
-            # MotherDuck에서는 DB가 없을 수 있으므로 생성 및 사용 설정
-            conn.execute("CREATE DATABASE IF NOT EXISTS dart_financials")
-            conn.execute("USE dart_financials")
-        else:
-            conn = duckdb.connect(DB_PATH)
-            
+    """테이블 생성/스키마 보정은 프로세스당 한 번만 수행합니다.
+
+    실패 시 예외를 그대로 올려 캐시되지 않도록 하고, 다음 rerun에서 다시 시도합니다.
+    """
+    with get_cursor() as conn:
         # 재무정보 테이블
         conn.execute("""
             CREATE TABLE IF NOT EXISTS cached_financials (
@@ -76,6 +113,13 @@ def init_db():
             )
         """)
 
+        # 회사/연도 단위 조회가 대부분이므로 보조 인덱스 추가
+        try:
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_cf_corp_year ON cached_financials(corp_code, year)")
+        except Exception as e:
+            # 인덱스는 없어도 조회는 가능하므로 초기화는 계속하되 서버 로그에 남김
+            print(f"[Database] Index creation failed: {e}", flush=True)
+
         # 회사 고유번호 테이블
         conn.execute("""
             CREATE TABLE IF NOT EXISTS corp_codes (
@@ -97,12 +141,31 @@ def init_db():
                 PRIMARY KEY (corp_code)
             )
         """)
-        conn.close()
-    except Exception as e:
-        st.error(f"데이터베이스 초기화 중 오류가 발생했습니다: {e}")
 
-# 앱 실행 시 DB 초기화
-init_db()
+        # [수정] 이전 스키마로 만들어진 테이블에 추가된 컬럼 보정
+        for alter_sql in (
+            "ALTER TABLE corp_codes ADD COLUMN IF NOT EXISTS stock_code VARCHAR",
+            "ALTER TABLE processing_status ADD COLUMN IF NOT EXISTS status VARCHAR DEFAULT 'SUCCESS'",
+        ):
+            try:
+                conn.execute(alter_sql)
+            except Exception as e:
+                print(f"[Database] Migration failed: {e}", flush=True)
+
+        # 회사별 연결/별도 구분 테이블 (Probing 결과 재사용)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS corp_fs_preference (
+                corp_code VARCHAR PRIMARY KEY,
+                fs_div VARCHAR,
+                determined_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+
+# 앱 실행 시 DB 초기화 (성공하면 rerun 시에는 캐시되어 생략)
+try:
+    init_db()
+except Exception as e:
+    st.error(f"데이터베이스 초기화 중 오류가 발생했습니다: {e}")
 
 # ==========================================
 # 2. DART 고유번호(Corp Code) 관리 (Cached)
@@ -114,43 +177,49 @@ def sync_corp_codes_from_api(api_key: str):
     params = {'crtfc_key': api_key}
 
     try:
-        response = requests.get(url, params=params)
-        if response.status_code == 200:
-            with zipfile.ZipFile(io.BytesIO(response.content)) as zip_file:
+        codes, names, stocks = [], [], []
+        # 응답 전체를 bytes + BytesIO로 이중 보관하지 않고 스트리밍으로 임시 파일(작으면 메모리)에 기록
+        with tempfile.SpooledTemporaryFile(max_size=32 << 20) as archive:
+            with get_http_session().get(url, params=params, stream=True, timeout=60) as response:
+                if response.status_code != 200:
+                    st.error(f"고유번호 동기화 실패: HTTP {response.status_code}")
+                    return False
+                response.raw.decode_content = True
+                shutil.copyfileobj(response.raw, archive)
+            archive.seek(0)
+
+            with zipfile.ZipFile(archive) as zip_file:
                 xml_filename = zip_file.namelist()[0]
                 with zip_file.open(xml_filename) as f:
-                    tree = ET.parse(f)
-                    root = tree.getroot()
-
-                    data_list = []
-                    for corp in root.findall('.//list'):
-                        code = corp.findtext('corp_code', '').strip()
-                        name = corp.findtext('corp_name', '').strip()
-                        stock = corp.findtext('stock_code', '').strip()
+                    # 전체 DOM을 만들지 않고 <list> 단위로 스트리밍 파싱
+                    for _, corp in etree.iterparse(f, tag='list'):
+                        # 자식 요소를 한 번만 순회해 값을 모음
+                        fields = {child.tag: child.text for child in corp}
+                        code = (fields.get('corp_code') or '').strip()
+                        name = (fields.get('corp_name') or '').strip()
+                        stock = (fields.get('stock_code') or '').strip()
                         # 주식 코드가 있는(상장사) 경우에만 추가
                         if code and name and stock:
-                            data_list.append((code, name, stock))
-
-            if data_list:
-                # 리스트를 DataFrame으로 변환 (성공적인 벌크 삽입을 위해)
-                df = pd.DataFrame(data_list, columns=['corp_code', 'corp_name', 'stock_code'])
-                
-                if MD_TOKEN:
-                    conn = duckdb.connect(DB_PATH, config={'motherduck_token': MD_TOKEN})
-                    conn.execute("USE dart_financials")
-                else:
-                    conn = duckdb.connect(DB_PATH)
-                
-                # [수정] 스키마 변경 시 컬럼 추가를 위해 처리
-                try:
-                    conn.execute("ALTER TABLE corp_codes ADD COLUMN IF NOT EXISTS stock_code VARCHAR")
-                except:
-                    pass
+                            codes.append(code)
+                            names.append(name)
+                            stocks.append(stock)
+                        # 처리한 요소와 앞선 형제 노드를 해제해 메모리 사용량을 일정하게 유지
+                        corp.clear()
+                        while corp.getprevious() is not None:
+                            del corp.getparent()[0]
+
+        if codes:
+            # 컬럼 단위 리스트로 DataFrame을 한 번에 생성 (행 단위 튜플 생성 없이 벌크 삽입)
+            # pyarrow 문자열 타입을 지정해 dtype 추론을 생략하고 object 대비 메모리를 절약
+            df = pd.DataFrame(
+                {'corp_code': codes, 'corp_name': names, 'stock_code': stocks},
+                dtype='string[pyarrow]'
+            )
 
+            with get_cursor() as conn:
                 # DuckDB의 강력한 기능을 활용해 DataFrame을 직접 테이블에 삽입 (매우 빠름)
                 conn.execute("INSERT OR REPLACE INTO corp_codes (corp_code, corp_name, stock_code) SELECT corp_code, corp_name, stock_code FROM df")
-                conn.close()
-                return True
+            return True
         return False
     except Exception as e:
         st.error(f"고유번호 동기화 실패: {e}")
@@ -160,26 +229,15 @@ def sync_corp_codes_from_api(api_key: str):
 def get_company_codes(api_key: str) -> Optional[Dict[str, str]]:
     """DB에서 고유번호를 읽어옵니다. DB에 없으면 API를 호출합니다."""
     try:
-        if MD_TOKEN:
-            conn = duckdb.connect(DB_PATH, config={'motherduck_token': MD_TOKEN})
-            conn.execute("USE dart_financials")
-        else:
-            conn = duckdb.connect(DB_PATH)
-        
-        df = conn.execute("SELECT corp_name, corp_code FROM corp_codes").df()
-        conn.close()
+        with get_cursor() as conn:
+            df = conn.execute("SELECT corp_name, corp_code FROM corp_codes").df()
 
         if df.empty:
             # DB가 비어있으면 API 호출 시도
             if sync_corp_codes_from_api(api_key):
-                if MD_TOKEN:
-                    conn = duckdb.connect(DB_PATH, config={'motherduck_token': MD_TOKEN})
-                    conn.execute("USE dart_financials")
-                else:
-                    conn = duckdb.connect(DB_PATH)
-                df = conn.execute("SELECT corp_name, corp_code FROM corp_codes").df()
-                conn.close()
-        
+                with get_cursor() as conn:
+                    df = conn.execute("SELECT corp_name, corp_code FROM corp_codes").df()
+
         if not df.empty:
             return df.set_index('corp_name')['corp_code'].to_dict()
         return None
@@ -187,6 +245,28 @@ def get_company_codes(api_key: str) -> Optional[Dict[str, str]]:
         st.error(f"고유번호 로드 실패: {e}")
         return None
 
+@st.cache_data(ttl=3600*24)  # 24시간 캐시
+def get_corp_code_to_name(api_key: str) -> Dict[str, str]:
+    """고유번호 -> 회사명 역방향 매핑 (처리 상태 기록 시 회사명 조회용)"""
+    codes_dict = get_company_codes(api_key)
+    if not codes_dict:
+        return {}
+    return {code: name for name, code in codes_dict.items()}
+
+def find_company_candidates(company_name: str, limit: int = 6) -> List[tuple]:
+    """회사명이 포함된 상장사를 DB에서 찾아 (회사명, 고유번호) 목록으로 반환합니다."""
+    try:
+        with get_cursor() as conn:
+            return conn.execute("""
+                SELECT corp_name, corp_code
+                FROM corp_codes
+                WHERE contains(corp_name, ?)
+                ORDER BY length(corp_name), corp_name
+                LIMIT ?
+            """, [company_name, int(limit)]).fetchall()
+    except Exception:
+        return []
+
 def search_company_code(api_key: str, company_name: str) -> Optional[str]:
     """회사명으로 고유번호를 검색합니다."""
     codes = get_company_codes(api_key)
@@ -197,12 +277,13 @@ def search_company_code(api_key: str, company_name: str) -> Optional[str]:
     if company_name in codes:
         return str(codes[company_name]).zfill(8)
 
-    # 2. 부분 일치 검색
-    candidates = [name for name in codes.keys() if company_name in name]
+    # 2. 부분 일치 검색 (전체 목록을 순회하지 않고 DB에서 필터링)
+    candidates = find_company_candidates(company_name)
     if len(candidates) == 1:
-        return str(codes[candidates[0]]).zfill(8)
+        return str(candidates[0][1]).zfill(8)
     elif len(candidates) > 1:
-        st.warning(f"검색 결과가 너무 많습니다. 더 정확한 이름을 입력해주세요. (후보: {', '.join(candidates[:5])}...)")
+        candidate_names = [name for name, _ in candidates[:5]]
+        st.warning(f"검색 결과가 너무 많습니다. 더 정확한 이름을 입력해주세요. (후보: {', '.join(candidate_names)}...)")
         return None
     else:
         return None
@@ -211,7 +292,38 @@ def search_company_code(api_key: str, company_name: str) -> Optional[str]:
 # 3. 재무제표 데이터 수집 및 DB 관리
 # ==========================================
 
+# 수집 대상 계정 (DART account_id → 표시 항목명)
+KEY_ACCOUNTS = {'ifrs-full_Revenue': '매출액', 'dart_OperatingIncomeLoss': '영업이익'}
+
+# 분기 -> (보고서코드, 보고서명)
+REPORT_BY_QUARTER = {
+    1: ('11013', '1분기보고서'),
+    2: ('11012', '반기보고서'),
+    3: ('11014', '3분기보고서'),
+    4: ('11011', '사업보고서'),
+}
+
+# cached_financials 테이블과 동일한 Arrow 스키마 (저장 시 타입 추론 생략)
+CACHED_FINANCIALS_SCHEMA = pa.schema([
+    ('corp_code', pa.string()),
+    ('year', pa.int32()),
+    ('quarter', pa.int32()),
+    ('report_code', pa.string()),
+    ('fs_div', pa.string()),
+    ('account_id', pa.string()),
+    ('account_nm', pa.string()),
+    ('thstrm_amount', pa.int64()),
+])
+
+class DartApiError(Exception):
+    """DART API가 한도 초과/점검/요청 실패 등 '데이터 없음'이 아닌 오류를 반환했을 때 발생합니다."""
+
 def get_financial_data(api_key: str, corp_code: str, year: int, report_type: str, fs_div: str, session: requests.Session = None) -> Optional[pd.DataFrame]:
+    """단일 보고서의 재무제표를 조회합니다.
+
+    데이터가 없으면(status 000의 빈 목록/013) None을 반환하고,
+    그 밖의 상태나 요청 실패는 나중에 다시 시도해야 하므로 DartApiError를 발생시킵니다.
+    """
     url = "https://opendart.fss.or.kr/api/fnlttSinglAcntAll.json"
     params = {
         'crtfc_key': api_key,
@@ -222,89 +334,126 @@ def get_financial_data(api_key: str, corp_code: str, year: int, report_type: str
     }
     
     try:
-        if session:
-            res = session.get(url, params=params, timeout=10)
-        else:
-            res = requests.get(url, params=params, timeout=10)
-        data = res.json()
-        
-        if data['status'] == '000' and data.get('list'):
-            df = pd.DataFrame(data['list'])
-            numeric_cols = ['thstrm_amount', 'frmtrm_amount', 'bfefrmtrm_amount']
-            for col in numeric_cols:
-                if col in df.columns:
-                    df[col] = pd.to_numeric(df[col].str.replace(',', ''), errors='coerce')
+        res = (session or get_http_session()).get(url, params=params, timeout=10)
+        # 표준 json 대신 C 구현 파서로 응답 바이트를 직접 디코딩
+        data = orjson.loads(res.content)
+    except Exception as e:
+        raise DartApiError(f"DART API 요청 실패: {e}") from e
+
+    status = data.get('status')
+    if status == '000' and data.get('list'):
+        try:
+            # 응답의 수십 개 필드 중 이후 로직에서 읽는 컬럼만으로 생성
+            df = pd.DataFrame.from_records(data['list'], columns=['account_id', 'account_nm', 'thstrm_amount'])
+            # 수백 개 계정 중 사용하는 계정만 남겨 이후 변환/병합 비용을 줄임
+            df = df[df['account_id'].isin(KEY_ACCOUNTS.keys())].reset_index(drop=True)
+            df['thstrm_amount'] = pd.to_numeric(
+                df['thstrm_amount'].str.replace(',', '', regex=False), errors='coerce'
+            )
             return df
+        except Exception:
+            return None
+    # 013: 조회된 데이터 없음
+    if status in ('000', '013'):
         return None
-    except Exception:
-        return None
+    # 020(요청 제한 초과), 800(시스템 점검) 등은 데이터 없음으로 확정하지 않음
+    raise DartApiError(f"DART API 오류 (status {status}: {data.get('message', '')})")
+
+def get_financial_data_bulk_from_db(corp_code: str, keys: List[tuple]) -> Dict[tuple, pd.DataFrame]:
+    """여러 (년도, 보고서코드, fs_div)의 캐시 데이터를 한 번의 쿼리로 읽어 키별로 나눕니다.
+
+    저장할 때마다 바뀌는 테이블이므로 st.cache_data로 감싸지 않고 조회마다 DB를 읽습니다
+    (일시적 오류는 이번 조회에서만 빈 결과로 처리).
+    """
+    if not keys:
+        return {}
+
+    placeholders = ", ".join(["(?, ?, ?)"] * len(keys))
+    params = [str(corp_code)]
+    for year, report_code, fs_div in keys:
+        params.extend([int(year), str(report_code), str(fs_div)])
 
-def get_financial_data_from_db(corp_code: str, year: int, report_code: str, fs_div: str) -> Optional[pd.DataFrame]:
     try:
-        if MD_TOKEN:
-            conn = duckdb.connect(DB_PATH, config={'motherduck_token': MD_TOKEN})
-            conn.execute("USE dart_financials")
-        else:
-            conn = duckdb.connect(DB_PATH)
-            
-        query = """
-            SELECT account_id, account_nm, thstrm_amount 
-            FROM cached_financials 
-            WHERE corp_code = ? AND year = ? AND report_code = ? AND fs_div = ?
+        query = f"""
+            SELECT year, report_code, fs_div, account_id, account_nm, thstrm_amount
+            FROM cached_financials
+            WHERE corp_code = ? AND (year, report_code, fs_div) IN ({placeholders})
         """
-        df = conn.execute(query, [str(corp_code), int(year), str(report_code), str(fs_div)]).df()
-        conn.close()
-        return df if not df.empty else None
+        with get_cursor() as conn:
+            df = conn.execute(query, params).df()
     except Exception:
-        return None
+        return {}
+
+    return {
+        (int(year), report_code, fs_div): group[['account_id', 'account_nm', 'thstrm_amount']].reset_index(drop=True)
+        for (year, report_code, fs_div), group in df.groupby(['year', 'report_code', 'fs_div'], sort=False)
+    }
 
-def save_financial_data_to_db(df: pd.DataFrame, corp_code: str, year: int, quarter: int, report_code: str, fs_div: str):
-    if df is None or df.empty:
+def build_financial_rows(df: pd.DataFrame, corp_code: str, year: int, quarter: int, report_code: str, fs_div: str) -> pd.DataFrame:
+    """API 응답에서 저장 대상 계정만 골라 cached_financials 스키마로 변환합니다."""
+    cols = ['corp_code', 'year', 'quarter', 'report_code', 'fs_div', 'account_id', 'account_nm', 'thstrm_amount']
+    target_df = df[df['account_id'].isin(KEY_ACCOUNTS.keys())]
+
+    return target_df.assign(
+        corp_code=str(corp_code),
+        year=int(year),
+        quarter=int(quarter),
+        report_code=str(report_code),
+        fs_div=str(fs_div),
+        thstrm_amount=target_df['thstrm_amount'].fillna(0).astype('int64')
+    )[cols]
+
+def save_financial_rows_to_db(rows_df: pd.DataFrame):
+    """여러 보고서의 저장 대상 행을 한 번의 INSERT로 기록합니다."""
+    if rows_df is None or rows_df.empty:
         return
 
     try:
-        if MD_TOKEN:
-            conn = duckdb.connect(DB_PATH, config={'motherduck_token': MD_TOKEN})
-            conn.execute("USE dart_financials")
-        else:
-            conn = duckdb.connect(DB_PATH)
-            
-        key_items = ['ifrs-full_Revenue', 'dart_OperatingIncomeLoss']
-        target_df = df[df['account_id'].isin(key_items)].copy()
-        
-        if target_df.empty:
-            conn.close()
-            return
-            
-        data_to_insert = []
-        for _, row in target_df.iterrows():
-            data_to_insert.append((
-                str(corp_code),
-                int(year),
-                int(quarter),
-                str(report_code),
-                str(fs_div),
-                row['account_id'],
-                row['account_nm'],
-                int(row['thstrm_amount']) if pd.notna(row['thstrm_amount']) else 0
-            ))
-            
-        conn.executemany("""
-            INSERT OR REPLACE INTO cached_financials 
-            (corp_code, year, quarter, report_code, fs_div, account_id, account_nm, thstrm_amount)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """, data_to_insert)
-        conn.close()
+        # 테이블 스키마에 맞춘 Arrow 테이블로 변환해 DuckDB가 복사 없이 읽도록 함
+        arrow_batch = pa.Table.from_pandas(rows_df, schema=CACHED_FINANCIALS_SCHEMA, preserve_index=False)
+
+        with get_cursor() as conn:
+            conn.register('arrow_batch', arrow_batch)
+            conn.execute("""
+                INSERT OR REPLACE INTO cached_financials
+                SELECT corp_code, year, quarter, report_code, fs_div, account_id, account_nm, thstrm_amount
+                FROM arrow_batch
+            """)
+            conn.unregister('arrow_batch')
     except Exception as e:
         st.error(f"데이터베이스 저장 중 오류가 발생했습니다: {e}")
 
+def get_fs_preference(corp_code: str) -> Optional[str]:
+    """이전 Probing으로 확정된 회사의 연결/별도 구분(CFS/OFS)을 조회합니다."""
+    try:
+        with get_cursor() as conn:
+            # 연결 대상 여부가 바뀔 수 있으므로 오래된 기록은 무시하고 다시 Probing
+            row = conn.execute("""
+                SELECT fs_div
+                FROM corp_fs_preference
+                WHERE corp_code = ? AND determined_at >= CURRENT_TIMESTAMP - INTERVAL 180 DAY
+            """, [str(corp_code)]).fetchone()
+        return row[0] if row else None
+    except Exception:
+        return None
+
+def save_fs_preference(corp_code: str, fs_div: str):
+    """Probing으로 확정된 연결/별도 구분을 저장합니다."""
+    try:
+        with get_cursor() as conn:
+            conn.execute("""
+                INSERT OR REPLACE INTO corp_fs_preference (corp_code, fs_div, determined_at)
+                VALUES (?, ?, CURRENT_TIMESTAMP)
+            """, [str(corp_code), str(fs_div)])
+    except Exception:
+        pass
+
 def get_quarter_info(year_month: int) -> tuple:
     year = year_month // 100
     month = year_month % 100
-    if month <= 3: return 1, year, 3
-    elif month <= 6: return 2, year, 6
-    elif month <= 9: return 3, year, 9
-    else: return 4, year, 12
+    # 1~3월 -> 1분기, ..., 10~12월 -> 4분기 (범위 밖 값은 1/4분기로 보정)
+    quarter = min(max((month + 2) // 3, 1), 4)
+    return quarter, year, quarter * 3
 
 def adjust_q4_values(df: pd.DataFrame) -> pd.DataFrame:
     """4분기 누적값을 실제 4분기 값으로 조정"""
@@ -318,8 +467,10 @@ def adjust_q4_values(df: pd.DataFrame) -> pd.DataFrame:
     group_cols = [col for col in ['corp_code', '구분'] if col in df.columns]
     merge_keys = group_cols + ['년도', '항목']
 
+    # 4분기 데이터가 있는 연도의 1~3분기만 합산
+    q4_years = df.loc[q4_mask, '년도'].unique()
     q1_q3_sum = (
-        df[df['분기'].isin([1, 2, 3])]
+        df[df['분기'].isin([1, 2, 3]) & df['년도'].isin(q4_years)]
         .groupby(merge_keys, dropna=False)['thstrm_amount']
         .sum()
         .rename('q1_q3_sum')
@@ -330,7 +481,7 @@ def adjust_q4_values(df: pd.DataFrame) -> pd.DataFrame:
         return df
 
     adjusted_df = df.copy()
-    q4_rows = adjusted_df.loc[q4_mask].copy()
+    q4_rows = adjusted_df.loc[q4_mask]
     q4_with_sum = q4_rows.merge(q1_q3_sum, on=merge_keys, how='left')
     has_prior_quarters = q4_with_sum['q1_q3_sum'].notna()
 
@@ -350,166 +501,170 @@ def collect_financials(api_key: str, corp_code: str, year_month: int) -> pd.Data
     report_types = [('사업보고서', '11011'), ('1분기보고서', '11013'), ('반기보고서', '11012'), ('3분기보고서', '11014')]
     fs_divs = [('연결', 'CFS'), ('별도', 'OFS')]
     
-    quarter, quarter_end_year, quarter_end_month = get_quarter_info(year_month)
+    quarter, quarter_end_year, _ = get_quarter_info(year_month)
     start_year = quarter_end_year - 4
-    
-    # 수집할 분기 목록 생성
-    quarters_to_collect = []
-    curr_y, curr_q = start_year, 1
-    end_y, end_q = quarter_end_year, quarter
-    if quarter_end_month == 12: end_q = 4
-
-    while True:
-        quarters_to_collect.append((curr_y, curr_q))
-        if curr_y == end_y and curr_q == end_q: break
-        curr_q += 1
-        if curr_q > 4:
-            curr_q = 1
-            curr_y += 1
+
+    # 수집할 분기 목록 생성 (년도*4 + 분기 인덱스로 직접 계산)
+    start_index = start_year * 4
+    end_index = quarter_end_year * 4 + quarter - 1
+    quarters_to_collect = [(idx // 4, idx % 4 + 1) for idx in range(start_index, end_index + 1)]
 
     all_data = []
     missing_tasks = []
-    determined_fs_divs = fs_divs 
+    # 한도 초과 등 재시도해야 하는 API 오류 (있으면 처리 완료로 기록하지 않음)
+    api_errors: List[DartApiError] = []
+    determined_fs_divs = fs_divs
+
+    # 이전에 확정된 연결/별도 구분이 있으면 해당 구분만 조회/수집
+    preferred_fs = get_fs_preference(corp_code)
+    if preferred_fs:
+        determined_fs_divs = [(fs_name, fs_code) for fs_name, fs_code in fs_divs if fs_code == preferred_fs]
 
     # Status 컨테이너
     status_text = st.empty()
     
-    with requests.Session() as session:
-        # 1. DB 조회
-        for t_year, t_quarter in quarters_to_collect:
-            if t_quarter == 1: r_code, r_name = '11013', '1분기보고서'
-            elif t_quarter == 2: r_code, r_name = '11012', '반기보고서'
-            elif t_quarter == 3: r_code, r_name = '11014', '3분기보고서'
-            else: r_code, r_name = '11011', '사업보고서'
-
-            found_in_db = False
-            for fs_name, fs_code in determined_fs_divs:
-                db_df = get_financial_data_from_db(corp_code, t_year, r_code, fs_code)
-                if db_df is not None:
-                    db_df['보고서명'] = r_name
-                    db_df['구분'] = fs_name
-                    db_df['년도'] = t_year
-                    db_df['분기'] = t_quarter
-                    all_data.append(db_df)
-                    found_in_db = True
-                    if fs_code == 'CFS' and len(determined_fs_divs) > 1:
-                        determined_fs_divs = [('연결', 'CFS')]
-                    break
-            
-            if not found_in_db:
-                missing_tasks.append((t_year, t_quarter, r_code, r_name))
-
-        # 2. API Probing & Fetching
-        if missing_tasks:
-            status_text.text(f"API 데이터 수집 중... ({len(missing_tasks)}건)")
-            
-            # Probing (연결/별도 확정)
-            if len(determined_fs_divs) > 1:
-                sorted_missing = sorted(missing_tasks, key=lambda x: (x[0], x[1]), reverse=True)
-                for t_year, t_quarter, t_report_code, _ in sorted_missing:
-                    cfs_df = get_financial_data(api_key, corp_code, t_year, t_report_code, 'CFS', session)
-                    if cfs_df is not None:
-                        determined_fs_divs = [('연결', 'CFS')]
-                        save_financial_data_to_db(cfs_df, corp_code, t_year, t_quarter, t_report_code, 'CFS')
+    session = get_http_session()
+
+    # 1. DB 조회 (전체 분기를 한 번의 쿼리로 읽은 뒤 분기별로 확인)
+    quarter_reports = [
+        (t_year, t_quarter, *REPORT_BY_QUARTER[t_quarter])
+        for t_year, t_quarter in quarters_to_collect
+    ]
+
+    cached_by_key = get_financial_data_bulk_from_db(
+        corp_code,
+        [(t_year, r_code, fs_code) for t_year, _, r_code, _ in quarter_reports for _, fs_code in determined_fs_divs]
+    )
+
+    for t_year, t_quarter, r_code, r_name in quarter_reports:
+        found_in_db = False
+        for fs_name, fs_code in determined_fs_divs:
+            db_df = cached_by_key.get((t_year, r_code, fs_code))
+            if db_df is not None:
+                db_df['보고서명'] = r_name
+                db_df['구분'] = fs_name
+                db_df['년도'] = t_year
+                db_df['분기'] = t_quarter
+                all_data.append(db_df)
+                found_in_db = True
+                if fs_code == 'CFS' and len(determined_fs_divs) > 1:
+                    determined_fs_divs = [('연결', 'CFS')]
+                break
+        
+        if not found_in_db:
+            missing_tasks.append((t_year, t_quarter, r_code, r_name))
+
+    # 2. API Probing & Fetching
+    if missing_tasks:
+        status_text.text(f"API 데이터 수집 중... ({len(missing_tasks)}건)")
+
+        # Probing (연결/별도 확정) - 성공한 응답은 바로 결과에 포함
+        pending_rows = []
+        # 이번 조회에서 이미 호출한 (년도, 보고서코드, fs_div) 응답 (실패 포함) - 병렬 단계에서 재호출하지 않음
+        api_cache: Dict[tuple, Optional[pd.DataFrame]] = {}
+        if len(determined_fs_divs) > 1:
+            sorted_missing = sorted(missing_tasks, key=lambda x: (x[0], x[1]), reverse=True)
+            for t_year, t_quarter, t_report_code, t_report_name in sorted_missing:
+                probed_df = None
+                for fs_name, fs_code in fs_divs:
+                    try:
+                        probed_df = get_financial_data(api_key, corp_code, t_year, t_report_code, fs_code, session)
+                    except DartApiError as e:
+                        api_errors.append(e)
                         break
-                    ofs_df = get_financial_data(api_key, corp_code, t_year, t_report_code, 'OFS', session)
-                    if ofs_df is not None:
-                        determined_fs_divs = [('별도', 'OFS')]
-                        save_financial_data_to_db(ofs_df, corp_code, t_year, t_quarter, t_report_code, 'OFS')
+                    api_cache[(t_year, t_report_code, fs_code)] = probed_df
+                    if probed_df is not None:
                         break
 
-            # 병렬 호출 준비
-            api_tasks = []
-            for t_year, t_quarter, t_report_code, t_report_name in missing_tasks:
-                # Probing 후 DB 다시 확인
-                found_after_probing = False
-                for fs_name, fs_code in determined_fs_divs:
-                    db_df_check = get_financial_data_from_db(corp_code, t_year, t_report_code, fs_code)
-                    if db_df_check is not None:
-                        db_df_check['보고서명'] = t_report_name
-                        db_df_check['구분'] = fs_name
-                        db_df_check['년도'] = t_year
-                        db_df_check['분기'] = t_quarter
-                        all_data.append(db_df_check)
-                        found_after_probing = True
-                        break
-                
-                if found_after_probing: continue
-
-                for fs_name, fs_code in determined_fs_divs:
-                    api_tasks.append({
-                        'year': t_year, 'quarter': t_quarter, 'report_code': t_report_code,
-                        'report_name': t_report_name, 'fs_code': fs_code, 'fs_name': fs_name
-                    })
-
-            # 병렬 실행
-            if api_tasks:
-                with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-                    future_to_task = {
-                        executor.submit(get_financial_data, api_key, corp_code, t['year'], t['report_code'], t['fs_code'], session): t 
-                        for t in api_tasks
-                    }
-                    for future in concurrent.futures.as_completed(future_to_task):
-                        task = future_to_task[future]
-                        try:
-                            df = future.result()
-                            if df is not None:
-                                save_financial_data_to_db(df, corp_code, task['year'], task['quarter'], task['report_code'], task['fs_code'])
-                                df['보고서명'] = task['report_name']
-                                df['구분'] = task['fs_name']
-                                df['년도'] = task['year']
-                                df['분기'] = task['quarter']
-                                all_data.append(df)
-                        except Exception:
-                            pass
+                # 연결 조회가 오류로 끝났으면 별도로 확정하지 않고 Probing 중단
+                if api_errors:
+                    break
+
+                if probed_df is not None:
+                    determined_fs_divs = [(fs_name, fs_code)]
+                    save_fs_preference(corp_code, fs_code)
+                    pending_rows.append(build_financial_rows(probed_df, corp_code, t_year, t_quarter, t_report_code, fs_code))
+                    probed_df['보고서명'] = t_report_name
+                    probed_df['구분'] = fs_name
+                    probed_df['년도'] = t_year
+                    probed_df['분기'] = t_quarter
+                    all_data.append(probed_df)
+                    break
+
+        # 병렬 호출 준비 (Probing에서 이미 호출한 요청은 제외)
+        api_tasks = []
+        for t_year, t_quarter, t_report_code, t_report_name in missing_tasks:
+            for fs_name, fs_code in determined_fs_divs:
+                if (t_year, t_report_code, fs_code) in api_cache:
+                    continue
+                api_tasks.append({
+                    'year': t_year, 'quarter': t_quarter, 'report_code': t_report_code,
+                    'report_name': t_report_name, 'fs_code': fs_code, 'fs_name': fs_name
+                })
+
+        # 병렬 실행 (결과는 모아서 한 번에 저장)
+        if api_tasks:
+            # 남은 보고서를 한 번에 요청해 대기 시간을 왕복 1~2회 수준으로 줄임
+            with concurrent.futures.ThreadPoolExecutor(max_workers=min(len(api_tasks), API_MAX_WORKERS)) as executor:
+                future_to_task = {
+                    executor.submit(get_financial_data, api_key, corp_code, t['year'], t['report_code'], t['fs_code'], session): t
+                    for t in api_tasks
+                }
+                for future in concurrent.futures.as_completed(future_to_task):
+                    task = future_to_task[future]
+                    try:
+                        df = future.result()
+                        if df is not None:
+                            pending_rows.append(build_financial_rows(df, corp_code, task['year'], task['quarter'], task['report_code'], task['fs_code']))
+                            df['보고서명'] = task['report_name']
+                            df['구분'] = task['fs_name']
+                            df['년도'] = task['year']
+                            df['분기'] = task['quarter']
+                            all_data.append(df)
+                    except DartApiError as e:
+                        api_errors.append(e)
+                    except Exception:
+                        pass
+
+        if pending_rows:
+            save_financial_rows_to_db(pd.concat(pending_rows, ignore_index=True))
 
     status_text.empty() # 상태 메시지 지우기
 
     if not all_data:
+        if api_errors:
+            # 데이터 없음으로 보이지 않도록 오류로 알림 (처리 상태도 기록하지 않아 다음에 다시 수집)
+            raise api_errors[0]
         return pd.DataFrame()
 
     # 데이터 정리
     combined = pd.concat(all_data, ignore_index=True)
-    filtered = combined[['보고서명', '구분', 'account_id', 'account_nm', 'thstrm_amount', '년도', '분기']].copy()
-    
-    item_map = {'ifrs-full_Revenue': '매출액', 'dart_OperatingIncomeLoss': '영업이익'}
-    filtered = filtered[filtered['account_id'].isin(item_map.keys())]
-    filtered['항목'] = filtered['account_id'].map(item_map)
+    # 행/열 선택과 항목 매핑을 한 번에 처리해 중간 복사본을 만들지 않음
+    filtered = combined.loc[
+        combined['account_id'].isin(KEY_ACCOUNTS.keys()),
+        ['보고서명', '구분', 'account_id', 'account_nm', 'thstrm_amount', '년도', '분기']
+    ].assign(항목=lambda d: d['account_id'].map(KEY_ACCOUNTS))
 
     # Q4 조정
     result_df = adjust_q4_values(filtered)
     
+    # 일부 보고서가 API 오류로 빠졌으면 완료로 기록하지 않음 (자동 수집이 다음 실행에 다시 시도)
+    if api_errors:
+        return result_df
+
     # 처리 상태 업데이트 (데이터가 있든 없든 시도 기록)
     try:
-        if MD_TOKEN:
-            conn = duckdb.connect(DB_PATH, config={'motherduck_token': MD_TOKEN})
-            conn.execute("USE dart_financials")
-        else:
-            conn = duckdb.connect(DB_PATH)
-        
-        # [수정] 스키마 변경 시 컬럼 추가
-        try:
-            conn.execute("ALTER TABLE processing_status ADD COLUMN IF NOT EXISTS status VARCHAR DEFAULT 'SUCCESS'")
-        except:
-            pass
-
-        # 회사명 가져오기
-        codes_dict = get_company_codes(api_key)
-        company_name_found = "알수없음"
-        if codes_dict:
-            for name, code in codes_dict.items():
-                if code == corp_code:
-                    company_name_found = name
-                    break
+        with get_cursor() as conn:
+            # 회사명 가져오기
+            company_name_found = get_corp_code_to_name(api_key).get(corp_code, "알수없음")
 
-        # 데이터 존재 여부에 따른 상태 설정
-        current_status = 'SUCCESS' if not result_df.empty else 'NOT_FOUND'
+            # 데이터 존재 여부에 따른 상태 설정
+            current_status = 'SUCCESS' if not result_df.empty else 'NOT_FOUND'
 
-        conn.execute("""
-            INSERT OR REPLACE INTO processing_status (corp_code, corp_name, last_base_period, status, processed_at)
-            VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
-        """, [corp_code, company_name_found, str(year_month), current_status])
-        conn.close()
+            conn.execute("""
+                INSERT OR REPLACE INTO processing_status (corp_code, corp_name, last_base_period, status, processed_at)
+                VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+            """, [corp_code, company_name_found, str(year_month), current_status])
     except Exception:
         pass
 
@@ -520,33 +675,29 @@ def process_dataframe_for_view(df: pd.DataFrame) -> pd.DataFrame:
     if df.empty:
         return pd.DataFrame()
 
-    pivot_df = df.pivot_table(
-        index=['년도', '분기'],
-        columns='항목',
-        values='thstrm_amount',
-        aggfunc='first'
-    ).reset_index()
-
-    # 정렬
-    pivot_df = pivot_df.sort_values(by=['년도', '분기'], ascending=[True, True])
-
-    # 기간 컬럼 생성
-    pivot_df['기간'] = pivot_df.apply(lambda x: f"{int(x['년도'])}년 {int(x['분기'])}분기", axis=1)
-
-    # 영업이익률 계산
-    pivot_df['매출액'] = pivot_df['매출액'].fillna(0)
-    pivot_df['영업이익'] = pivot_df['영업이익'].fillna(0)
-    
-    pivot_df['영업이익률'] = pivot_df.apply(
-        lambda row: (row['영업이익'] / row['매출액'] * 100) if row['매출액'] != 0 else 0, axis=1
-    )
-
-    # 컬럼 순서 정리 및 단위 변환 (백만원)
-    result_df = pivot_df[['기간', '매출액', '영업이익', '영업이익률']].copy()
-    result_df['매출액'] = result_df['매출액'] / 1000000
-    result_df['영업이익'] = result_df['영업이익'] / 1000000
-    
-    return result_df
+    # 피벗, 기간 문자열, 영업이익률, 단위 변환(백만원)을 DuckDB 쿼리 한 번으로 처리
+    query = """
+        WITH pivoted AS (
+            SELECT
+                년도,
+                분기,
+                COALESCE(ANY_VALUE(thstrm_amount) FILTER (WHERE 항목 = '매출액'), 0) AS 매출액,
+                COALESCE(ANY_VALUE(thstrm_amount) FILTER (WHERE 항목 = '영업이익'), 0) AS 영업이익
+            FROM view_src
+            GROUP BY 년도, 분기
+            HAVING COUNT(thstrm_amount) > 0
+        )
+        SELECT
+            CAST(년도 AS INTEGER) || '년 ' || CAST(분기 AS INTEGER) || '분기' AS 기간,
+            매출액 / 1000000 AS 매출액,
+            영업이익 / 1000000 AS 영업이익,
+            CASE WHEN 매출액 <> 0 THEN 영업이익 / 매출액 * 100 ELSE 0 END AS 영업이익률
+        FROM pivoted
+        ORDER BY 년도, 분기
+    """
+    with duckdb.connect() as conn:
+        conn.register('view_src', df[['년도', '분기', '항목', 'thstrm_amount']])
+        return conn.execute(query).df()
 
 def screen_companies_by_margin(
     num_quarters: int,
@@ -555,12 +706,6 @@ def screen_companies_by_margin(
 ) -> pd.DataFrame:
     """DB에 저장된 전체 회사 데이터 중 최근 N개 분기 영업이익률 조건을 만족하는 회사를 찾는다."""
     try:
-        if MD_TOKEN:
-            conn = duckdb.connect(DB_PATH, config={'motherduck_token': MD_TOKEN})
-            conn.execute("USE dart_financials")
-        else:
-            conn = duckdb.connect(DB_PATH)
-
         query = """
             WITH prioritized AS (
                 SELECT
@@ -593,8 +738,8 @@ def screen_companies_by_margin(
             FROM prioritized
             WHERE fs_rank = 1
         """
-        raw_df = conn.execute(query).df()
-        conn.close()
+        with get_cursor() as conn:
+            raw_df = conn.execute(query).df()
     except Exception as e:
         st.error(f"조건 검색 데이터를 불러오는 중 오류가 발생했습니다: {e}")
         return pd.DataFrame()
@@ -602,14 +747,11 @@ def screen_companies_by_margin(
     if raw_df.empty:
         return pd.DataFrame()
 
-    raw_df['항목'] = raw_df['account_id'].map({
-        'ifrs-full_Revenue': '매출액',
-        'dart_OperatingIncomeLoss': '영업이익'
-    })
+    raw_df['항목'] = raw_df['account_id'].map(KEY_ACCOUNTS)
     raw_df['corp_name'] = raw_df['corp_name'].fillna(raw_df['corp_code'])
 
     adjusted_df = adjust_q4_values(
-        raw_df[['corp_code', 'corp_name', 'stock_code', '구분', 'thstrm_amount', '년도', '분기', '항목']].copy()
+        raw_df[['corp_code', 'corp_name', 'stock_code', '구분', 'thstrm_amount', '년도', '분기', '항목']]
     )
 
     quarterly_df = (
@@ -626,19 +768,22 @@ def screen_companies_by_margin(
     if quarterly_df.empty or '매출액' not in quarterly_df.columns or '영업이익' not in quarterly_df.columns:
         return pd.DataFrame()
 
-    quarterly_df = quarterly_df.dropna(subset=['매출액', '영업이익']).copy()
-    quarterly_df = quarterly_df[quarterly_df['매출액'] > 0].copy()
+    # 매출액 결측은 > 0 비교에서 함께 제외됨
+    quarterly_df = quarterly_df[quarterly_df['영업이익'].notna() & (quarterly_df['매출액'] > 0)].copy()
     if quarterly_df.empty:
         return pd.DataFrame()
 
     quarterly_df['영업이익률'] = (quarterly_df['영업이익'] / quarterly_df['매출액']) * 100
-    quarterly_df['기간'] = quarterly_df.apply(lambda row: f"{int(row['년도'])}년 {int(row['분기'])}분기", axis=1)
+    quarterly_df['기간'] = (
+        quarterly_df['년도'].astype(int).astype(str) + '년 '
+        + quarterly_df['분기'].astype(int).astype(str) + '분기'
+    )
     quarterly_df['기간인덱스'] = (quarterly_df['년도'] * 4) + quarterly_df['분기'] - 1
     quarterly_df['매출액(백만)'] = quarterly_df['매출액'] / 1000000
     quarterly_df['영업이익(백만)'] = quarterly_df['영업이익'] / 1000000
     quarterly_df['분기순번'] = quarterly_df.groupby('corp_code').cumcount() + 1
 
-    recent_df = quarterly_df[quarterly_df['분기순번'] <= num_quarters].copy()
+    recent_df = quarterly_df[quarterly_df['분기순번'] <= num_quarters]
     if recent_df.empty:
         return pd.DataFrame()
 
@@ -679,14 +824,10 @@ def screen_companies_by_margin(
         )
         .reset_index()
     )
+    filtered_df['분기이력'] = filtered_df['기간'] + ' ' + filtered_df['영업이익률'].map('{:.2f}%'.format)
     quarter_history = (
-        filtered_df.groupby('corp_code')
-        .apply(
-            lambda group: " | ".join(
-                f"{period} {margin:.2f}%"
-                for period, margin in zip(group['기간'], group['영업이익률'])
-            )
-        )
+        filtered_df.groupby('corp_code', sort=False)['분기이력']
+        .agg(' | '.join)
         .rename('최근분기이력')
         .reset_index()
     )
@@ -703,6 +844,80 @@ def screen_companies_by_margin(
         ascending=[False, False, True]
     ).reset_index(drop=True)
 
+# 차트 레이아웃/트레이스 스타일은 고정값이므로 모듈 로드 시 한 번만 생성
+CHART_BASE_LAYOUT = go.Layout(
+    title=dict(
+        text='📈 핵심 재무지표 추이 분석',
+        font=dict(size=18, color='#111111', family='Inter')
+    ),
+    hovermode='x unified',
+    plot_bgcolor='rgba(252,252,252,0.5)',
+    paper_bgcolor='rgba(0,0,0,0)',
+    margin=dict(l=50, r=50, t=100, b=50),
+    legend=dict(
+        orientation="h",
+        yanchor="bottom",
+        y=1.05,
+        xanchor="right",
+        x=1,
+        font=dict(size=11, color='#666666')
+    ),
+    xaxis=dict(
+        title='',
+        showgrid=False,
+        tickfont=dict(size=11, color='#8e8e93'),
+        linecolor='#eaeaea'
+    ),
+    yaxis=dict(
+        title='영업이익률 (%)',
+        side='left',
+        showgrid=True,
+        gridcolor='#f2f2f7',
+        ticksuffix='%',
+        tickfont=dict(size=11, color='#007aff')
+    ),
+    yaxis2=dict(
+        title='금액 (백만)',
+        side='right',
+        overlaying='y',
+        showgrid=False,
+        tickfont=dict(size=11, color='#8e8e93'),
+        tickformat=',.0f'
+    ),
+    bargap=0.35,
+    height=500,
+    font=dict(family='Inter, sans-serif')
+)
+
+CHART_TRACE_STYLES = {
+    # Primary Y-axis: 영업이익률 (Smooth Line)
+    'margin_rate': dict(
+        name='영업이익률 (%)',
+        mode='lines+markers',
+        line=dict(color='#007aff', width=3, shape='spline'),
+        marker=dict(size=8, color='#ffffff', line=dict(color='#007aff', width=2), symbol='circle'),
+        yaxis='y',
+        hovertemplate='<b>%{x}</b><br>영업이익률: %{y:.2f}%<extra></extra>'
+    ),
+    # Secondary Y-axis: 매출액 (Bar)
+    'revenue': dict(
+        name='매출액 (백만)',
+        marker=dict(color='#e5e5ea', opacity=0.8, line=dict(width=0)),
+        yaxis='y2',
+        hovertemplate='<b>%{x}</b><br>매출액: %{y:,.0f}백만<extra></extra>'
+    ),
+    # Secondary Y-axis: 영업이익 (Bar)
+    'operating_income': dict(
+        name='영업이익 (백만)',
+        marker=dict(color='#34c759', opacity=0.8, line=dict(width=0)),
+        yaxis='y2',
+        hovertemplate='<b>%{x}</b><br>영업이익: %{y:,.0f}백만<extra></extra>'
+    ),
+}
+
+# 모드바(툴바)는 사용하지 않으므로 숨김
+CHART_CONFIG = {'displayModeBar': False}
+
 def render_financial_analysis(company_name: str, raw_df: pd.DataFrame):
     """기업별 재무 조회 결과 차트와 표를 렌더링한다."""
     view_df = process_dataframe_for_view(raw_df)
@@ -768,77 +983,14 @@ def render_financial_analysis(company_name: str, raw_df: pd.DataFrame):
         )
     )
 
-    fig = go.Figure()
-    fig.add_trace(go.Scatter(
-        x=view_df['기간'],
-        y=view_df['영업이익률'],
-        name='영업이익률 (%)',
-        mode='lines+markers',
-        line=dict(color='#007aff', width=3, shape='spline'),
-        marker=dict(size=8, color='#ffffff', line=dict(color='#007aff', width=2), symbol='circle'),
-        yaxis='y',
-        hovertemplate='<b>%{x}</b><br>영업이익률: %{y:.2f}%<extra></extra>'
-    ))
-    fig.add_trace(go.Bar(
-        x=view_df['기간'],
-        y=view_df['매출액'],
-        name='매출액 (백만)',
-        marker=dict(color='#e5e5ea', opacity=0.8, line=dict(width=0)),
-        yaxis='y2',
-        hovertemplate='<b>%{x}</b><br>매출액: %{y:,.0f}백만<extra></extra>'
-    ))
-    fig.add_trace(go.Bar(
-        x=view_df['기간'],
-        y=view_df['영업이익'],
-        name='영업이익 (백만)',
-        marker=dict(color='#34c759', opacity=0.8, line=dict(width=0)),
-        yaxis='y2',
-        hovertemplate='<b>%{x}</b><br>영업이익: %{y:,.0f}백만<extra></extra>'
-    ))
-
+    fig = go.Figure(layout=CHART_BASE_LAYOUT)
+    fig.add_traces([
+        go.Scatter(x=view_df['기간'], y=view_df['영업이익률'], **CHART_TRACE_STYLES['margin_rate']),
+        go.Bar(x=view_df['기간'], y=view_df['매출액'], **CHART_TRACE_STYLES['revenue']),
+        go.Bar(x=view_df['기간'], y=view_df['영업이익'], **CHART_TRACE_STYLES['operating_income']),
+    ])
     fig.update_layout(
-        title=dict(
-            text='📈 핵심 재무지표 추이 분석',
-            font=dict(size=18, color='#111111', family='Inter')
-        ),
-        hovermode='x unified',
-        plot_bgcolor='rgba(252,252,252,0.5)',
-        paper_bgcolor='rgba(0,0,0,0)',
-        margin=dict(l=50, r=50, t=100, b=50),
-        legend=dict(
-            orientation="h",
-            yanchor="bottom",
-            y=1.05,
-            xanchor="right",
-            x=1,
-            font=dict(size=11, color='#666666')
-        ),
-        xaxis=dict(
-            title='',
-            showgrid=False,
-            tickfont=dict(size=11, color='#8e8e93'),
-            linecolor='#eaeaea'
-        ),
-        yaxis=dict(
-            title='영업이익률 (%)',
-            side='left',
-            showgrid=True,
-            gridcolor='#f2f2f7',
-            ticksuffix='%',
-            tickfont=dict(size=11, color='#007aff'),
-            range=[min(0, view_df['영업이익률'].min() * 1.5), max(view_df['영업이익률'].max() * 1.5, 10)]
-        ),
-        yaxis2=dict(
-            title='금액 (백만)',
-            side='right',
-            overlaying='y',
-            showgrid=False,
-            tickfont=dict(size=11, color='#8e8e93'),
-            tickformat=',.0f'
-        ),
-        bargap=0.35,
-        height=500,
-        font=dict(family='Inter, sans-serif')
+        yaxis_range=[min(0, view_df['영업이익률'].min() * 1.5), max(view_df['영업이익률'].max() * 1.5, 10)]
     )
 
     actual_max = view_df['영업이익률'].max()
@@ -863,7 +1015,7 @@ def render_financial_analysis(company_name: str, raw_df: pd.DataFrame):
         annotation_font=dict(color='#2ECC71', size=10)
     )
 
-    st.plotly_chart(fig, use_container_width=True)
+    st.plotly_chart(fig, use_container_width=True, config=CHART_CONFIG)
     st.divider()
     st.html(gt_table.as_raw_html())
 
@@ -871,34 +1023,28 @@ def render_financial_analysis(company_name: str, raw_df: pd.DataFrame):
 def get_db_storage_status() -> tuple[int, pd.DataFrame]:
     """DB에 저장된 회사 수와 기준연월별 저장 현황을 요약한다."""
     try:
-        if MD_TOKEN:
-            conn = duckdb.connect(DB_PATH, config={'motherduck_token': MD_TOKEN})
-            conn.execute("USE dart_financials")
-        else:
-            conn = duckdb.connect(DB_PATH)
-
-        total_companies = conn.execute("""
-            SELECT COUNT(DISTINCT corp_code)
-            FROM cached_financials
-        """).fetchone()[0] or 0
-
-        period_df = conn.execute("""
-            WITH stored_companies AS (
-                SELECT DISTINCT corp_code
+        with get_cursor() as conn:
+            total_companies = conn.execute("""
+                SELECT COUNT(DISTINCT corp_code)
                 FROM cached_financials
-            )
-            SELECT
-                ps.last_base_period AS 기준연월,
-                COUNT(DISTINCT ps.corp_code) AS 회사수
-            FROM processing_status ps
-            INNER JOIN stored_companies sc ON ps.corp_code = sc.corp_code
-            WHERE ps.status = 'SUCCESS'
-              AND ps.last_base_period IS NOT NULL
-              AND TRIM(ps.last_base_period) <> ''
-            GROUP BY ps.last_base_period
-            ORDER BY ps.last_base_period DESC
-        """).df()
-        conn.close()
+            """).fetchone()[0] or 0
+
+            period_df = conn.execute("""
+                WITH stored_companies AS (
+                    SELECT DISTINCT corp_code
+                    FROM cached_financials
+                )
+                SELECT
+                    ps.last_base_period AS 기준연월,
+                    COUNT(DISTINCT ps.corp_code) AS 회사수
+                FROM processing_status ps
+                INNER JOIN stored_companies sc ON ps.corp_code = sc.corp_code
+                WHERE ps.status = 'SUCCESS'
+                  AND ps.last_base_period IS NOT NULL
+                  AND TRIM(ps.last_base_period) <> ''
+                GROUP BY ps.last_base_period
+                ORDER BY ps.last_base_period DESC
+            """).df()
     except Exception as e:
         st.error(f"DB 저장 현황을 불러오는 중 오류가 발생했습니다: {e}")
         return 0, pd.DataFrame()
@@ -919,7 +1065,7 @@ def get_db_storage_status() -> tuple[int, pd.DataFrame]:
 # ==========================================
 
 # Custom CSS for Value Horizon Look & Feel
-st.markdown("""
+APP_CSS = """
 <style>
     @import url('https://fonts.googleapis.com/css2?family=Inter:wght@400;600;700&display=swap');
 
@@ -1288,14 +1434,17 @@ st.markdown("""
         }
     }
 </style>
-""", unsafe_allow_html=True)
+"""
 
 # Hero Section
-st.markdown("""
+HERO_HTML = """
 <div class="hero-container">
     <div class="hero-title">📈 Search DART</div>
 </div>
-""", unsafe_allow_html=True)
+"""
+
+# 정적 CSS/Hero는 매 rerun마다 하나의 요소로 한 번만 전송
+st.markdown(APP_CSS + HERO_HTML, unsafe_allow_html=True)
 
 if not API_KEY:
     st.error("🚨 DART API Key가 설정되지 않았습니다. Streamlit Secrets에 `DART_API_KEY`를 설정해주세요.")
@@ -1533,187 +1682,11 @@ if search_btn and company_name and year_month:
                         status.update(label="❌ 데이터 없음", state="error")
                         st.warning("해당 기간의 재무 데이터를 찾을 수 없습니다.")
                     else:
-                        view_df = process_dataframe_for_view(raw_df)
                         elapsed = time.time() - start_time
 
                         status.update(label=f"✅ 조회 완료! ({elapsed:.2f}초)", state="complete")
 
-                        st.markdown(f"### 🏢 {company_name} <small style='color: #666; font-size: 0.6em;'>재무 실적 분석</small>", unsafe_allow_html=True)
-
-                        # ==========================================================
-                        # Great Tables Styling Logic (Value Horizon Premium)
-                        # ==========================================================
-                        gt_table = (
-                            gt.GT(view_df)
-                            .fmt_number(
-                                columns=["매출액", "영업이익"],
-                                decimals=0,
-                                use_seps=True
-                            )
-                            .fmt_number(
-                                columns=["영업이익률"],
-                                decimals=2
-                            )
-                            .fmt(
-                                columns=["영업이익률"],
-                                fns=lambda x: f"{x:.2f}%"
-                            )
-                            # 1. 컬럼 레이블 스타일
-                            .tab_style(
-                                style=[
-                                    gt.style.text(weight="600", color="#111111"),
-                                    gt.style.fill(color="#ffffff"),
-                                ],
-                                locations=gt.loc.column_labels()
-                            )
-                            # 2. 본문 셀 스타일
-                            .tab_style(
-                                style=[
-                                    gt.style.borders(sides="bottom", color="#f0f0f0", weight="1px"),
-                                    gt.style.text(color="#1a1a1a")
-                                ],
-                                locations=gt.loc.body()
-                            )
-                            # 3. '기간' 컬럼 강조 (Value Horizon Blue Accent)
-                            .tab_style(
-                                style=[
-                                    gt.style.text(weight="600", color="#007aff"),
-                                ],
-                                locations=gt.loc.body(columns=["기간"])
-                            )
-                            # 4. 매출/영익 강조
-                            .tab_style(
-                                style=[
-                                    gt.style.text(weight="500")
-                                ],
-                                locations=gt.loc.body(columns=["매출액", "영업이익"])
-                            )
-                            .tab_options(
-                                table_font_size="13px",
-                                table_width="100%",
-                                column_labels_font_size="14px",
-                                table_border_top_style="none",
-                                table_border_bottom_style="none",
-                                column_labels_border_top_style="none",
-                                column_labels_border_bottom_width="2px",
-                                column_labels_border_bottom_color="#111111",
-                                table_font_names="Inter",
-                                row_striping_include_table_body=True,
-                                row_striping_background_color="#f9f9f9"
-                            )
-                        )
-
-                        # 차트 시각화
-                        fig = go.Figure()
-
-                        # Primary Y-axis: 영업이익률 (Smooth Line)
-                        fig.add_trace(go.Scatter(
-                            x=view_df['기간'],
-                            y=view_df['영업이익률'],
-                            name='영업이익률 (%)',
-                            mode='lines+markers',
-                            line=dict(color='#007aff', width=3, shape='spline'),
-                            marker=dict(size=8, color='#ffffff', line=dict(color='#007aff', width=2), symbol='circle'),
-                            yaxis='y',
-                            hovertemplate='<b>%{x}</b><br>영업이익률: %{y:.2f}%<extra></extra>'
-                        ))
-
-                        # Secondary Y-axis: 매출액 (Bar)
-                        fig.add_trace(go.Bar(
-                            x=view_df['기간'],
-                            y=view_df['매출액'],
-                            name='매출액 (백만)',
-                            marker=dict(color='#e5e5ea', opacity=0.8, line=dict(width=0)),
-                            yaxis='y2',
-                            hovertemplate='<b>%{x}</b><br>매출액: %{y:,.0f}백만<extra></extra>'
-                        ))
-
-                        # Secondary Y-axis: 영업이익 (Bar)
-                        fig.add_trace(go.Bar(
-                            x=view_df['기간'],
-                            y=view_df['영업이익'],
-                            name='영업이익 (백만)',
-                            marker=dict(color='#34c759', opacity=0.8, line=dict(width=0)),
-                            yaxis='y2',
-                            hovertemplate='<b>%{x}</b><br>영업이익: %{y:,.0f}백만<extra></extra>'
-                        ))
-
-                        # 레이아웃 설정
-                        fig.update_layout(
-                            title=dict(
-                                text='📈 핵심 재무지표 추이 분석',
-                                font=dict(size=18, color='#111111', family='Inter')
-                            ),
-                            hovermode='x unified',
-                            plot_bgcolor='rgba(252,252,252,0.5)',
-                            paper_bgcolor='rgba(0,0,0,0)',
-                            margin=dict(l=50, r=50, t=100, b=50),
-                            legend=dict(
-                                orientation="h",
-                                yanchor="bottom",
-                                y=1.05,
-                                xanchor="right",
-                                x=1,
-                                font=dict(size=11, color='#666666')
-                            ),
-                            xaxis=dict(
-                                title='',
-                                showgrid=False,
-                                tickfont=dict(size=11, color='#8e8e93'),
-                                linecolor='#eaeaea'
-                            ),
-                            yaxis=dict(
-                                title='영업이익률 (%)',
-                                side='left',
-                                showgrid=True,
-                                gridcolor='#f2f2f7',
-                                ticksuffix='%',
-                                tickfont=dict(size=11, color='#007aff'),
-                                range=[min(0, view_df['영업이익률'].min() * 1.5), max(view_df['영업이익률'].max() * 1.5, 10)]
-                            ),
-                            yaxis2=dict(
-                                title='금액 (백만)',
-                                side='right',
-                                overlaying='y',
-                                showgrid=False,
-                                tickfont=dict(size=11, color='#8e8e93'),
-                                tickformat=',.0f'
-                            ),
-                            bargap=0.35,
-                            height=500,
-                            font=dict(family='Inter, sans-serif')
-                        )
-
-                        actual_max = view_df['영업이익률'].max()
-                        actual_min = view_df['영업이익률'].min()
-
-                        fig.add_hline(
-                            y=actual_max,
-                            line_dash="dot",
-                            line_color="#2ECC71",
-                            line_width=1.5,
-                            annotation_text=f"최대: {actual_max:.1f}%",
-                            annotation_position="right",
-                            annotation_font=dict(color='#2ECC71', size=10)
-                        )
-
-                        fig.add_hline(
-                            y=actual_min,
-                            line_dash="dot",
-                            line_color="#2ECC71",
-                            line_width=1.5,
-                            annotation_text=f"최소: {actual_min:.1f}%",
-                            annotation_position="right",
-                            annotation_font=dict(color='#2ECC71', size=10)
-                        )
-
-                        # 차트 먼저 출력 (너비 확보)
-                        st.plotly_chart(fig, use_container_width=True)
-                        
-                        st.divider()
-                        
-                        # 표 출력
-                        st.html(gt_table.as_raw_html())
+                        render_financial_analysis(company_name, raw_df)
 
                 except Exception as e:
                     status.update(label="❌ 오류 발생", state="error")
@@ -1,8 +1,10 @@
 import os
+import json
+import asyncio
 import duckdb
-import time
 import pandas as pd
-from playwright.sync_api import sync_playwright
+import pyarrow as pa
+from playwright.async_api import async_playwright
 
 # 설정
 MD_TOKEN = os.getenv("MOTHERDUCK_TOKEN")
@@ -10,12 +12,54 @@ API_KEY = os.getenv("DART_API_KEY")
 DB_PATH = "md:"
 APP_URL = "https://search-dart.streamlit.app/~/+/"
 DEFAULT_PERIOD = "202603" # 기본 기준연월
-BATCH_SIZE = 50 # 한 번에 처리할 회사 수
+# 한 번에 처리할 회사 수
+# DART 일일 호출 한도(키당 20,000건) 기준: 30분마다 하루 48회 × 10개사 × 회사당 최대 약 19건 ≈ 9,100건
+# (앱 사용자 조회 몫을 남겨 두도록 한도의 절반 이하로 유지)
+BATCH_SIZE = int(os.getenv("BATCH_SIZE", "10"))
+STATUS_FLUSH_SIZE = 10 # 실패 상태를 모아서 기록할 건수
+STATUS_FLUSH_INTERVAL = 2.0 # 실패 상태를 기록하기까지 최대 대기 시간(초)
+MAX_CONCURRENCY = int(os.getenv("MAX_CONCURRENCY", "5")) # 동시에 조회할 브라우저 컨텍스트 수
+# 실행 간 HTTP 캐시(JS 번들 등)를 유지할 브라우저 프로필 경로 (CI에서는 actions/cache로 보존)
+USER_DATA_DIR = os.getenv("PW_USER_DATA_DIR", ".pw-userdata")
+# CI 러너용 Chromium 옵션 (/dev/shm 부족 크래시 방지, GPU/부가 기능 비활성화로 기동 시간·메모리 절감)
+CHROMIUM_ARGS = [
+    "--disable-dev-shm-usage",
+    "--disable-gpu",
+    "--disable-extensions",
+    "--disable-background-networking",
+    "--disable-sync",
+    "--no-first-run",
+    "--mute-audio",
+    # 워커 페이지는 모두 백그라운드 탭이므로 타이머/렌더러 스로틀링을 꺼서 결과 표시가 지연되지 않도록 함
+    "--disable-background-timer-throttling",
+    "--disable-renderer-backgrounding",
+    "--disable-backgrounding-occluded-windows",
+    # 이미지는 결과 판정에 쓰이지 않으므로 로드하지 않음
+    # (요청 라우팅으로 차단하면 Playwright가 HTTP 캐시를 끄므로 브라우저 설정으로 처리)
+    "--blink-settings=imagesEnabled=false",
+    # 웹 폰트도 판정과 무관하므로 내려받지 않음 (시스템 폰트로 렌더링)
+    "--disable-remote-fonts",
+]
+
+# rerun 중에는 이전 실행의 요소가 data-stale로 표시된 채 화면에 남아 있으므로 판정 대상에서 제외
+NOT_STALE = ':not([data-stale="true"] *)'
+# 회사와 무관한 실패 문구를 하나의 선택자로 합쳐 대기 중 폴링마다 DOM을 한 번만 조회
+GENERIC_ERROR_SELECTOR = ", ".join(selector + NOT_STALE for selector in [
+    'summary:has-text("회사를 찾을 수 없습니다")',
+    'p:has-text("데이터 없음")',
+    'p:has-text("❌")',
+    'p:has-text("데이터를 찾을 수 없습니다")',
+    'p:has-text("회사명을 입력해주세요")',
+    'p:has-text("기준 연월을 입력해주세요")',
+])
+# 앱이 DART 한도 초과/점검 등으로 조회를 끝내지 못한 경우 (NOT_FOUND로 기록하지 않고 다음 실행에 재시도)
+RETRYABLE_ERROR_SELECTOR = 'p:has-text("처리 중 오류가 발생했습니다")' + NOT_STALE
 
 import requests
 import zipfile
-import io
-import xml.etree.ElementTree as ET
+import shutil
+import tempfile
+from lxml import etree
 
 def connect_motherduck():
     """MotherDuck 연결을 한 곳에서 처리하고 확장 설치 오류를 명확히 보고합니다."""
@@ -31,6 +75,71 @@ def connect_motherduck():
             ) from e
         raise
 
+_CONN = None
+_SCHEMA_READY = False
+
+def get_conn():
+    """프로세스 전체에서 MotherDuck 연결을 한 번만 열어 재사용합니다."""
+    global _CONN
+    if _CONN is None:
+        print(f"[Database] Connecting to MotherDuck (Path: {DB_PATH})...", flush=True)
+        _CONN = connect_motherduck()
+        print("[Database] Connected. Initializing tables...", flush=True)
+        ensure_schema(_CONN)
+    return _CONN
+
+def get_cursor():
+    """공유 연결에서 dart_financials를 사용하는 커서를 만듭니다 (워커 스레드마다 별도 커서)."""
+    cursor = get_conn().cursor()
+    cursor.execute("USE dart_financials")
+    return cursor
+
+def close_conn():
+    global _CONN
+    if _CONN is not None:
+        _CONN.close()
+        _CONN = None
+
+# DB/테이블 생성을 한 번의 호출로 실행 (MotherDuck 왕복 횟수 최소화)
+SCHEMA_SQL = """
+    CREATE DATABASE IF NOT EXISTS dart_financials;
+    USE dart_financials;
+    CREATE TABLE IF NOT EXISTS corp_codes (
+        corp_code VARCHAR PRIMARY KEY,
+        corp_name VARCHAR,
+        stock_code VARCHAR,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE IF NOT EXISTS processing_status (
+        corp_code VARCHAR,
+        corp_name VARCHAR,
+        last_base_period VARCHAR,
+        status VARCHAR DEFAULT 'SUCCESS',
+        processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (corp_code)
+    );
+"""
+
+# [수정] 스키마 변경 시 컬럼 추가를 위해 처리 (IF NOT EXISTS이므로 실패는 로그로 남기고 실행은 계속)
+SCHEMA_MIGRATIONS = (
+    "ALTER TABLE corp_codes ADD COLUMN IF NOT EXISTS stock_code VARCHAR",
+    "ALTER TABLE processing_status ADD COLUMN IF NOT EXISTS status VARCHAR DEFAULT 'SUCCESS'",
+)
+
+def ensure_schema(conn):
+    """DB/테이블 생성과 스키마 보정은 프로세스당 한 번만 수행합니다."""
+    global _SCHEMA_READY
+    if _SCHEMA_READY:
+        return
+
+    conn.execute(SCHEMA_SQL)
+    for alter_sql in SCHEMA_MIGRATIONS:
+        try:
+            conn.execute(alter_sql)
+        except Exception as e:
+            print(f"[Database] Migration failed: {e}", flush=True)
+    _SCHEMA_READY = True
+
 def sync_corp_codes():
     """DART API에서 회사 코드를 가져와 DB에 저장합니다."""
     if not API_KEY:
@@ -42,48 +151,46 @@ def sync_corp_codes():
     params = {'crtfc_key': API_KEY}
     
     try:
-        response = requests.get(url, params=params)
-        if response.status_code == 200:
-            with zipfile.ZipFile(io.BytesIO(response.content)) as zip_file:
+        codes, names, stocks = [], [], []
+        # 응답 전체를 bytes로 받은 뒤 BytesIO로 한 번 더 복사하지 않고, 스트리밍으로 임시 파일(작으면 메모리)에 기록
+        with tempfile.SpooledTemporaryFile(max_size=8 << 20) as archive:
+            with requests.get(url, params=params, stream=True, timeout=60) as response:
+                if response.status_code != 200:
+                    print(f"Failed to sync corp codes: HTTP {response.status_code}", flush=True)
+                    return False
+                response.raw.decode_content = True
+                shutil.copyfileobj(response.raw, archive)
+            archive.seek(0)
+
+            with zipfile.ZipFile(archive) as zip_file:
                 xml_filename = zip_file.namelist()[0]
                 with zip_file.open(xml_filename) as f:
-                    tree = ET.parse(f)
-                    root = tree.getroot()
-                    data_list = []
-                    for corp in root.findall('.//list'):
-                        code = corp.findtext('corp_code', '').strip()
-                        name = corp.findtext('corp_name', '').strip()
-                        stock = corp.findtext('stock_code', '').strip()
+                    # 전체 트리를 만들지 않고 <list> 단위로 스트리밍 파싱 (C 파서, 처리한 요소는 바로 해제)
+                    for _, corp in etree.iterparse(f, events=("end",), tag='list'):
+                        fields = {child.tag: child.text for child in corp}
+                        code = (fields.get('corp_code') or '').strip()
+                        name = (fields.get('corp_name') or '').strip()
+                        stock = (fields.get('stock_code') or '').strip()
                         # 주식 코드가 있는(상장사) 경우에만 추가
                         if code and name and stock:
-                            data_list.append((code, name, stock))
-            
-            if data_list:
-                print(f"[Database] Preparing to insert {len(data_list)} records...", flush=True)
-                df = pd.DataFrame(data_list, columns=['corp_code', 'corp_name', 'stock_code'])
-                
-                conn = connect_motherduck()
-                conn.execute("CREATE DATABASE IF NOT EXISTS dart_financials")
-                conn.execute("USE dart_financials")
-                conn.execute("""
-                    CREATE TABLE IF NOT EXISTS corp_codes (
-                        corp_code VARCHAR PRIMARY KEY,
-                        corp_name VARCHAR,
-                        stock_code VARCHAR,
-                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                """)
-                # [수정] 스키마 변경 시 컬럼 추가를 위해 처리
-                try:
-                    conn.execute("ALTER TABLE corp_codes ADD COLUMN IF NOT EXISTS stock_code VARCHAR")
-                except:
-                    pass
-
-                print("[Database] Executing bulk insert (INSERT OR REPLACE)...", flush=True)
-                conn.execute("INSERT OR REPLACE INTO corp_codes (corp_code, corp_name, stock_code) SELECT corp_code, corp_name, stock_code FROM df")
-                conn.close()
-                print(f"[Database] Successfully synced {len(data_list)} corp codes.", flush=True)
-                return True
+                            codes.append(code)
+                            names.append(name)
+                            stocks.append(stock)
+                        corp.clear()
+                        # 이미 처리한 형제 요소가 루트에 남지 않도록 제거
+                        while corp.getprevious() is not None:
+                            del corp.getparent()[0]
+
+        if codes:
+            print(f"[Database] Preparing to insert {len(codes)} records...", flush=True)
+            # pandas object 컬럼을 거치지 않고 Arrow 테이블로 만들어 DuckDB가 벡터 단위로 바로 읽도록 함
+            corp_table = pa.table({'corp_code': codes, 'corp_name': names, 'stock_code': stocks})
+
+            print("[Database] Executing bulk insert (INSERT OR REPLACE)...", flush=True)
+            with get_cursor() as conn:
+                conn.execute("INSERT OR REPLACE INTO corp_codes (corp_code, corp_name, stock_code) SELECT corp_code, corp_name, stock_code FROM corp_table")
+            print(f"[Database] Successfully synced {len(codes)} corp codes.", flush=True)
+            return True
         return False
     except Exception as e:
         print(f"Failed to sync corp codes: {e}")
@@ -92,190 +199,263 @@ def sync_corp_codes():
 def get_unprocessed_companies():
     """아직 처리되지 않았거나 최신 기준월보다 과거 상태인 회사 목록을 가져옵니다."""
     try:
-        print(f"[Database] Connecting to MotherDuck (Path: {DB_PATH})...", flush=True)
-        conn = connect_motherduck()
-        print("[Database] Connected. Initializing tables...", flush=True)
-        conn.execute("CREATE DATABASE IF NOT EXISTS dart_financials")
-        conn.execute("USE dart_financials")
-        
-        # 테이블 존재 확인 및 생성
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS corp_codes (
-                corp_code VARCHAR PRIMARY KEY,
-                corp_name VARCHAR,
-                stock_code VARCHAR,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        # [수정] 스키마 변경 시 컬럼 추가를 위해 처리
-        try:
-            conn.execute("ALTER TABLE corp_codes ADD COLUMN IF NOT EXISTS stock_code VARCHAR")
-        except:
-            pass
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS processing_status (
-                corp_code VARCHAR,
-                corp_name VARCHAR,
-                last_base_period VARCHAR,
-                status VARCHAR DEFAULT 'SUCCESS',
-                processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                PRIMARY KEY (corp_code)
-            )
-        """)
-        # [수정] 스키마 변경 시 컬럼 추가를 위해 처리
-        try:
-            conn.execute("ALTER TABLE processing_status ADD COLUMN IF NOT EXISTS status VARCHAR DEFAULT 'SUCCESS'")
-        except:
-            pass
-        
-        # 데이터가 있는지 확인
-        count = conn.execute("SELECT count(*) FROM corp_codes").fetchone()[0]
-        print(f"[Database] Current corp_codes count: {count}", flush=True)
-        if count == 0:
-            conn.close()
-            if sync_corp_codes():
-                return get_unprocessed_companies() # 재시도
-            return []
-
-        print("[Database] Fetching unprocessed companies...", flush=True)
-        query = """
-            SELECT c.corp_name, c.corp_code 
-            FROM corp_codes c
-            LEFT JOIN processing_status p ON c.corp_code = p.corp_code
-            WHERE
-                p.corp_code IS NULL
-                OR TRY_CAST(p.last_base_period AS INTEGER) IS NULL
-                OR TRY_CAST(p.last_base_period AS INTEGER) < ?
-            ORDER BY c.corp_code ASC
-            LIMIT ?
-        """
-        df = conn.execute(query, [int(DEFAULT_PERIOD), BATCH_SIZE]).df()
-        conn.close()
+        with get_cursor() as conn:
+            # 데이터가 있는지 확인
+            count = conn.execute("SELECT count(*) FROM corp_codes").fetchone()[0]
+            print(f"[Database] Current corp_codes count: {count}", flush=True)
+            if count == 0:
+                if sync_corp_codes():
+                    return get_unprocessed_companies() # 재시도
+                return []
+
+            print("[Database] Fetching unprocessed companies...", flush=True)
+            query = """
+                -- 기준월 이상으로 처리된 기록이 없는 회사 (기록 없음/기준월 파싱 불가/과거 기준월 포함)
+                SELECT c.corp_name, c.corp_code
+                FROM corp_codes c
+                -- 조회해도 NOT_FOUND로 끝날 비상장/비정상 코드는 브라우저로 보내기 전에 제외
+                WHERE c.stock_code IS NOT NULL AND c.stock_code <> ''
+                  AND length(c.corp_code) = 8
+                  AND NOT EXISTS (
+                    SELECT 1
+                    FROM processing_status p
+                    WHERE p.corp_code = c.corp_code
+                      AND TRY_CAST(p.last_base_period AS INTEGER) >= ?
+                )
+                ORDER BY c.corp_code ASC
+                LIMIT ?
+            """
+            df = conn.execute(query, [int(DEFAULT_PERIOD), BATCH_SIZE]).df()
         return df.to_dict('records')
     except Exception as e:
         print(f"[Database Error] {e}", flush=True)
         raise
 
-def update_status_to_not_found(corp_code, corp_name):
-    """실패한 경우(성공 외) 상태를 NOT_FOUND로 기록합니다."""
+def update_statuses_to_not_found(companies):
+    """실패한 회사(성공 외)들의 상태를 한 번의 쿼리로 NOT_FOUND 기록합니다.
+
+    성공한 회사는 앱이 조회 시 직접 SUCCESS로 기록하므로 여기서는 다루지 않습니다.
+    """
+    if not companies:
+        return
     try:
-        conn = connect_motherduck()
-        conn.execute("USE dart_financials")
-        conn.execute("""
-            INSERT OR REPLACE INTO processing_status (corp_code, corp_name, last_base_period, status, processed_at)
-            VALUES (?, ?, ?, 'NOT_FOUND', CURRENT_TIMESTAMP)
-        """, [corp_code, corp_name, DEFAULT_PERIOD])
-        conn.close()
-        print(f"  - [Fallback] Status recorded as NOT_FOUND for {corp_name}", flush=True)
+        df = pd.DataFrame(companies, columns=['corp_code', 'corp_name'])
+        with get_cursor() as conn:
+            conn.execute("""
+                INSERT OR REPLACE INTO processing_status (corp_code, corp_name, last_base_period, status, processed_at)
+                SELECT corp_code, corp_name, ?, 'NOT_FOUND', CURRENT_TIMESTAMP FROM df
+            """, [DEFAULT_PERIOD])
+        print(f"[Fallback] Status recorded as NOT_FOUND for {len(companies)} companies", flush=True)
     except Exception as e:
-        print(f"  - [Error] Failed to record fallback status: {e}", flush=True)
+        print(f"[Error] Failed to record fallback status: {e}", flush=True)
+
+async def status_writer(status_queue):
+    """워커가 넣은 실패 결과를 모아 STATUS_FLUSH_SIZE건 또는 STATUS_FLUSH_INTERVAL초마다 기록합니다.
+
+    DB 쓰기를 브라우저 대기와 겹쳐 실행 끝의 일괄 기록 대기를 없애고, 중단 시 유실도 줄입니다.
+    큐에 None이 들어오면 남은 결과를 기록하고 종료합니다.
+    """
+    loop = asyncio.get_running_loop()
+    buffer = []
+    deadline = None
+    while True:
+        timeout = None if not buffer else max(0.0, deadline - loop.time())
+        item = None
+        timed_out = False
+        try:
+            item = await asyncio.wait_for(status_queue.get(), timeout)
+        except asyncio.TimeoutError:
+            timed_out = True
+        finished = item is None and not timed_out
+
+        if item is not None:
+            if not buffer:
+                deadline = loop.time() + STATUS_FLUSH_INTERVAL
+            buffer.append(item)
+
+        if buffer and (timed_out or finished or len(buffer) >= STATUS_FLUSH_SIZE):
+            batch, buffer = buffer, []
+            await asyncio.to_thread(update_statuses_to_not_found, batch)
+
+        if finished:
+            return
+
+async def open_app(page):
+    """앱을 (다시) 로드하고 입력 폼이 나타날 때까지 기다립니다."""
+    print(f"  - Navigating to {APP_URL}...", flush=True)
+    # Streamlit은 WebSocket을 계속 유지하므로 networkidle 대신 DOM 로드 후 입력창 표시로 준비 여부 판단
+    await page.goto(APP_URL, wait_until="domcontentloaded", timeout=30000)
+
+    print("  - Waiting for Streamlit UI to load (30s timeout)...", flush=True)
+    input_selector = 'input[aria-label="회사명"]'
+    await page.locator(input_selector).wait_for(state="visible", timeout=30000)
+
+def build_page_locators(page):
+    """회사와 무관한 고정 locator를 페이지당 한 번만 만들어 재사용합니다."""
+    return {
+        'company_input': page.locator('input[aria-label="회사명"]'),
+        'period_input': page.locator('input[aria-label="기준 연월 (YYYYMM)"]'),
+        'submit_button': page.get_by_role("button", name="조회하기"),
+        'running_status': page.locator('summary:has-text("데이터를 조회하고 있습니다")'),
+    }
+
+def has_text_selector(tag, text):
+    """회사명에 따옴표가 있어도 깨지지 않도록 이스케이프한 :has-text 선택자를 만듭니다."""
+    return f"{tag}:has-text({json.dumps(text, ensure_ascii=False)}){NOT_STALE}"
+
+async def process_company(page, locators, company, index, total, reload, status_queue):
+    """한 회사를 앱에서 조회하고 결과(성공/실패)를 판정합니다.
+
+    이미 로드된 페이지는 폼만 다시 채워 재사용합니다 (Streamlit이 같은 세션에서 rerun).
+    실패한 회사는 status_queue로 넘겨 status_writer가 모아서 기록합니다.
+    페이지가 비정상 상태로 끝났으면 False를 반환해 다음 회사 처리 전에 다시 로드하도록 합니다.
+    """
+    name = company['corp_name']
+    code = company['corp_code']
+    tag = f"[{index}/{total}] {name}"
+    print(f"\n[{index}/{total}] Processing: {name} ({code})", flush=True)
 
-def run_automation():
-    print("--- Starting Automation Script ---", flush=True)
     try:
-        companies = get_unprocessed_companies()
-    except Exception:
-        print("[Status] Database initialization failed. Aborting automation run.", flush=True)
-        raise
-    if not companies:
-        print("[Status] No unprocessed companies found. Everything is up to date.", flush=True)
-        return
+        if reload:
+            await open_app(page)
 
-    print(f"[Status] Found {len(companies)} companies to process.", flush=True)
+        # 입력창은 st.form 안에 있어 값이 입력 즉시 폼 상태에 반영되고 제출 버튼을 눌러야 rerun됨
+        # (Enter는 그 자리에서 폼을 제출하므로 누르지 않고, 고정 sleep 없이 바로 다음 입력으로 진행)
+        print(f"  - {tag}: Filling company name", flush=True)
+        await locators['company_input'].fill(name)
 
-    with sync_playwright() as p:
-        print("[Playwright] Launching browser...", flush=True)
-        browser = p.chromium.launch(headless=True)
-        context = browser.new_context(viewport={'width': 1280, 'height': 800})
-        page = context.new_page()
+        print(f"  - {tag}: Filling period: {DEFAULT_PERIOD}", flush=True)
+        await locators['period_input'].fill(DEFAULT_PERIOD)
+
+        print(f"  - {tag}: Clicking '조회하기' button...", flush=True)
+        try:
+            # click은 버튼이 보이고 활성화될 때까지 자동으로 대기
+            await locators['submit_button'].click(timeout=3000)
+        except:
+            pass
+
+        # 성공 판정은 이번 회사명이 들어간 제목으로만 함 (이전 결과 오인 방지)
+        success_selector = has_text_selector("h3", f"🏢 {name} 재무")
+        not_found_selector = has_text_selector("p", f"'{name}' 회사를 찾을 수 없습니다")
+
+        print(f"  - {tag}: Waiting for data collection results (120s timeout)...", flush=True)
+        try:
+            # 페이지를 재사용하므로 이전 회사 결과가 화면에 남아 있음
+            # 이번 실행이 시작되고(실행 중 상태 또는 이번 회사명이 들어간 결과) 끝날 때까지 기다린 뒤 판정
+            run_started = locators['running_status'].or_(page.locator(f"{success_selector}, {not_found_selector}"))
+            await run_started.first.wait_for(state="visible", timeout=15000)
+            await locators['running_status'].first.wait_for(state="hidden", timeout=120000)
+
+            # 성공/실패 지표를 쉼표로 이은 단일 선택자로 대기 (폴링마다 지표별로 DOM을 조회하지 않음)
+            error_selector = f"{not_found_selector}, {GENERIC_ERROR_SELECTOR}"
+            combined_locator = page.locator(f"{success_selector}, {RETRYABLE_ERROR_SELECTOR}, {error_selector}")
+
+            # .first 를 사용하여 최소 하나라도 보이면 즉시 다음 단계로 진행
+            await combined_locator.first.wait_for(state="visible", timeout=120000)
+
+            # 성공 여부 최종 판정 (한 번의 조회)
+            is_success = await page.locator(f"{success_selector} >> visible=true").count() > 0
+
+            if is_success:
+                print(f"  - [Success] Successfully processed {name}", flush=True)
+                return True
+
+            retryable_texts = await page.locator(f"{RETRYABLE_ERROR_SELECTOR} >> visible=true").all_inner_texts()
+            if retryable_texts:
+                print(f"  - [Retry Later] App could not finish {name}: {retryable_texts[0].strip()}", flush=True)
+            else:
+                # 에러 메시지 추출 시도
+                # 보이는 오류 문구를 한 번의 호출로 가져옴 (count 후 inner_text 왕복 없음)
+                error_texts = await page.locator(f"{error_selector} >> visible=true").all_inner_texts()
+                error_msg = error_texts[0].strip() if error_texts else "Unknown Error"
+                print(f"  - [Warning] Data not found or error reported by app for {name}: {error_msg}", flush=True)
+                status_queue.put_nowait((code, name))
+        except Exception as e:
+            print(f"  - [Timeout/Error] Results did not appear within 120s for {name}. Error: {e}", flush=True)
+            status_queue.put_nowait((code, name))
+            return False
 
-        for i, company in enumerate(companies):
-            name = company['corp_name']
-            code = company['corp_code']
-            print(f"\n[{i+1}/{len(companies)}] Processing: {name} ({code})", flush=True)
+        return True
 
+    except Exception as e:
+        print(f"  - [Critical Error] Global failure for {name}: {e}", flush=True)
+        status_queue.put_nowait((code, name))
+        return False
+
+async def browser_worker(context, queue, total, status_queue):
+    """페이지 하나로 큐가 빌 때까지 회사를 순차 처리합니다 (Streamlit 세션은 페이지마다 독립)."""
+    page = await context.new_page()
+    locators = build_page_locators(page)
+    page_ready = False
+    try:
+        while True:
+            try:
+                index, company = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                break
+            # 첫 회사이거나 직전 처리에서 오류가 난 경우에만 앱을 다시 로드
+            page_ready = await process_company(page, locators, company, index, total, reload=not page_ready, status_queue=status_queue)
+    finally:
+        await page.close()
+
+async def run_pipeline():
+    """대상 회사 조회와 브라우저 기동을 동시에 진행한 뒤 회사를 병렬 처리합니다.
+
+    처리할 회사가 없으면 False를 반환합니다.
+    """
+    # 대상 조회(필요 시 DART 고유번호 동기화 포함)는 블로킹 I/O이므로 스레드에서 실행하고 그동안 브라우저를 띄움
+    companies_task = asyncio.create_task(asyncio.to_thread(get_unprocessed_companies))
+
+    async with async_playwright() as p:
+        print("[Playwright] Launching browser...", flush=True)
+        try:
+            # 영구 프로필로 실행해 이전 실행에서 받은 정적 리소스를 디스크 캐시에서 재사용
+            context = await p.chromium.launch_persistent_context(
+                USER_DATA_DIR,
+                headless=True,
+                args=CHROMIUM_ARGS,
+                viewport={'width': 1280, 'height': 800}
+            )
+        except Exception:
+            await asyncio.gather(companies_task, return_exceptions=True)
+            raise
+
+        status_queue = asyncio.Queue()
+        writer_task = asyncio.create_task(status_writer(status_queue))
+        try:
             try:
-                print(f"  - Navigating to {APP_URL}...", flush=True)
-                page.goto(APP_URL, wait_until="networkidle", timeout=30000)
-                
-                print("  - Waiting for Streamlit UI to load (30s timeout)...", flush=True)
-                input_selector = 'input[aria-label="회사명"]'
-                page.locator(input_selector).wait_for(state="visible", timeout=30000)
-                
-                print(f"  - Filling company name: {name}", flush=True)
-                page.get_by_label("회사명").fill(name)
-                page.get_by_label("회사명").press("Enter")
-                time.sleep(0.5) # Streamlit 상태 동기화 대기
-                
-                print(f"  - Filling period: {DEFAULT_PERIOD}", flush=True)
-                page.get_by_label("기준 연월 (YYYYMM)").fill(DEFAULT_PERIOD)
-                page.get_by_label("기준 연월 (YYYYMM)").press("Enter")
-                time.sleep(0.5) # Streamlit 상태 동기화 대기
-                
-                print("  - Clicking '조회하기' button...", flush=True)
-                try:
-                    page.get_by_role("button", name="조회하기").click(timeout=3000)
-                except:
-                    pass
-                
-                print("  - Waiting for data collection results (120s timeout)...", flush=True)
-                try:
-                    # 완결성 있는 성공/실패 판단을 위해 여러 지표를 한꺼번에 대기
-                    success_indicators = [
-                        page.locator('summary:has-text("조회 완료")'),
-                        page.locator('p:has-text("조회 완료")'),
-                        page.locator('h3:has-text("🏢")'),
-                        page.locator('h1:has-text("🏢")'), # 가끔 H1으로 나올 수 있음
-                        page.locator('h3:has-text("재무 추이")'),
-                        page.locator('[data-testid="stMetricValue"]') # 지표 박스
-                    ]
-                    
-                    error_indicators = [
-                        page.locator('summary:has-text("회사를 찾을 수 없습니다")'),
-                        page.locator('p:has-text("회사를 찾을 수 없습니다")'),
-                        page.locator('p:has-text("데이터 없음")'),
-                        page.locator('p:has-text("❌")'),
-                        page.locator('p:has-text("데이터를 찾을 수 없습니다")'),
-                        page.locator('p:has-text("회사명을 입력해주세요")'),
-                        page.locator('p:has-text("기준 연월을 입력해주세요")')
-                    ]
-                    
-                    # 모든 지표를 하나로 합침
-                    combined_locator = success_indicators[0]
-                    for loc in success_indicators[1:] + error_indicators:
-                        combined_locator = combined_locator.or_(loc)
-                    
-                    # .first 를 사용하여 최소 하나라도 보이면 즉시 다음 단계로 진행
-                    combined_locator.first.wait_for(state="visible", timeout=120000)
-                    
-                    # 성공 여부 최종 판정
-                    is_success = any(loc.is_visible() for loc in success_indicators)
-                    
-                    if is_success:
-                        print(f"  - [Success] Successfully processed {name}", flush=True)
-                    else:
-                        # 에러 메시지 추출 시도
-                        error_msg = "Unknown Error"
-                        for loc in error_indicators:
-                            if loc.is_visible():
-                                error_msg = loc.inner_text().strip()
-                                break
-                        print(f"  - [Warning] Data not found or error reported by app for {name}: {error_msg}", flush=True)
-                        update_status_to_not_found(code, name)
-                except Exception as e:
-                    print(f"  - [Timeout/Error] Results did not appear within 120s for {name}. Error: {e}", flush=True)
-                    update_status_to_not_found(code, name)
-                
-                # 서버 부하 방지를 위해 잠시 대기
-                print("  - Cooling down for 5 seconds...", flush=True)
-                time.sleep(5)
-                
-            except Exception as e:
-                print(f"  - [Critical Error] Global failure for {name}: {e}", flush=True)
-                update_status_to_not_found(code, name)
-
-        print("\n[Playwright] Closing browser...", flush=True)
-        browser.close()
+                companies = await companies_task
+            except Exception:
+                print("[Status] Database initialization failed. Aborting automation run.", flush=True)
+                raise
+            if not companies:
+                print("[Status] No unprocessed companies found. Everything is up to date.", flush=True)
+                return False
+
+            print(f"[Status] Found {len(companies)} companies to process.", flush=True)
+
+            queue = asyncio.Queue()
+            for index, company in enumerate(companies, start=1):
+                queue.put_nowait((index, company))
+
+            worker_count = max(1, min(MAX_CONCURRENCY, len(companies)))
+            print(f"[Playwright] Starting {worker_count} workers...", flush=True)
+            await asyncio.gather(*(browser_worker(context, queue, len(companies), status_queue) for _ in range(worker_count)))
+        finally:
+            print("\n[Playwright] Closing browser...", flush=True)
+            await context.close()
+            # 중간에 중단되더라도 그때까지의 실패 결과는 기록
+            status_queue.put_nowait(None)
+            await writer_task
+    return True
+
+def run_automation():
+    print("--- Starting Automation Script ---", flush=True)
+    try:
+        if not asyncio.run(run_pipeline()):
+            return
+    finally:
+        close_conn()
     print("--- Automation Task Finished ---", flush=True)
 
 if __name__ == "__main__":